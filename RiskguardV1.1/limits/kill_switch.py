@@ -13,6 +13,8 @@ import win32con
 
 HERE = os.path.dirname(os.path.abspath(__file__))
 STATE_FILE = os.path.join(HERE, ".riskguard_state.json")
+MT5_WINDOW_CLASS = "MetaQuotes::MetaTrader::5.00"
+_MT5_HWND: Optional[int] = None
 
 # ------------------ STATE FILE ------------------
 def _load_state() -> Dict[str, Any]:
@@ -29,49 +31,82 @@ def _save_state(data: Dict[str, Any]) -> None:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 # ------------------ WINDOW TOGGLE ------------------
+def _find_mt5_window(login_str: str, server: str) -> int:
+    """
+    Localiza a janela principal do MT5 da conta (login e servidor no título).
+    Ordem: HWND já encontrado antes -> janelas da classe do MT5 -> varredura completa.
+    """
+    global _MT5_HWND
+
+    def _matches(hwnd) -> bool:
+        try:
+            if not hwnd or not win32gui.IsWindow(hwnd):
+                return False
+            title = win32gui.GetWindowText(hwnd)
+        except Exception:
+            return False
+        return bool(title) and login_str in title and server in title
+
+    if _matches(_MT5_HWND):
+        return _MT5_HWND
+
+    hwnd = 0
+    try:
+        # só as janelas de topo da classe do MT5 (normalmente uma por terminal)
+        h = win32gui.FindWindowEx(0, 0, MT5_WINDOW_CLASS, None)
+        while h:
+            if _matches(h):
+                hwnd = h
+                break
+            h = win32gui.FindWindowEx(0, h, MT5_WINDOW_CLASS, None)
+    except Exception:
+        hwnd = 0
+
+    if not hwnd:
+        # fallback: classe diferente (build/skin) → varre todas as janelas de topo
+        def enum_callback(h, results):
+            if _matches(h):
+                results.append(h)
+
+        hwnds = []
+        win32gui.EnumWindows(enum_callback, hwnds)
+        hwnd = hwnds[0] if hwnds else 0
+
+    _MT5_HWND = hwnd or None
+    return hwnd
+
 def _toggle_autotrade(new_state: bool):
     """new_state=True ativa / new_state=False desativa"""
     if not mt5.initialize():
         return False
 
-    account = mt5.account_info()
-    info = mt5.terminal_info()
-    if not account:
-        mt5.shutdown()
-        return False
-
-    # se já está no estado desejado → nada a fazer
-    if info.trade_allowed == new_state:
-        mt5.shutdown()
-        return True
+    try:
+        account = mt5.account_info()
+        info = mt5.terminal_info()
+        if not account:
+            return False
 
-    login_str = str(account.login)
-    server = account.server
+        # se já está no estado desejado → nada a fazer
+        if info.trade_allowed == new_state:
+            return True
 
-    def enum_callback(hwnd, results):
-        title = win32gui.GetWindowText(hwnd)
-        if title and login_str in title and server in title:
-            results.append(hwnd)
+        hwnd = _find_mt5_window(str(account.login), account.server)
+        if not hwnd:
+            return False
 
-    hwnds = []
-    win32gui.EnumWindows(enum_callback, hwnds)
+        # Comando padrão real do MT5 para toggle AutoTrading
+        win32api.PostMessage(hwnd, win32con.WM_COMMAND, 32851, 0)
 
-    if not hwnds:
-        mt5.shutdown()
+        # Aguarda o terminal aplicar o novo estado (sem shutdown/initialize no meio)
+        time.sleep(0.3)
+        for _ in range(20):
+            info2 = mt5.terminal_info()
+            if info2 and info2.trade_allowed == new_state:
+                return True
+            time.sleep(0.1)
         return False
-
-    hwnd = hwnds[0]
-
-    # Comando padrão real do MT5 para toggle AutoTrading
-    win32api.PostMessage(hwnd, win32con.WM_COMMAND, 32851, 0)
-    time.sleep(0.6)
-
-    mt5.shutdown()
-    mt5.initialize()
-    info2 = mt5.terminal_info()
-
-    mt5.shutdown()
-    return info2.trade_allowed == new_state
+    finally:
+        mt5.shutdown()
 
 # ------------------ PUBLIC API ------------------
 def set_kill_until(dt_utc):
@@ -1,10 +1,10 @@
 # limits.py — Função 3: risco agregado <= limite; tentativas + bloqueio temporário de AutoTrading
 from __future__ import annotations
 from typing import Any, Dict, List, Set
-from datetime import datetime, timedelta
-import os, json
-import pytz
-from rg_config import get_float, get_int
+from datetime import datetime, timedelta, timezone
+import os, json, copy, time
+from concurrent.futures import ThreadPoolExecutor
+from rg_config import get_bool, get_float, get_int
 from logger import log_event
 from notify import notify_limits
 
@@ -12,30 +12,182 @@ from mt5_reader import RiskGuardMT5Reader
 from .guard import close_position_full
 from .kill_switch import set_kill_until, kill_status
 
+try:
+    import orjson  # serializador nativo (opcional); sem ele usa o json da stdlib
+except ImportError:
+    orjson = None
+
 HERE = os.path.dirname(os.path.abspath(__file__))
-STATE_FILE = os.path.join(HERE, ".riskguard_limits.json")
+STATE_FILE = os.path.join(HERE, ".riskguard_limits.json")  # snapshot (baseline ordenado)
+STATE_LOG = STATE_FILE + ".log"  # diário append-only de deltas sobre o snapshot
+STATE_LOG_COMPACT_BYTES = 4096   # acima disso o diário é consolidado num novo snapshot
+STATE_PRETTY = False  # True grava o JSON indentado (só para inspeção manual)
+LAST_STATE_MAX_AGE_S = 1.0     # risk_block_status reaproveita o estado do último enforce até essa idade
 DEFAULT_THRESHOLD_PCT = get_float("AGGREGATE_MAX_RISK", 5.0)
 DEFAULT_MAX_ATTEMPTS = get_int("AGGREGATE_MAX_ATTEMPTS", 3)
 DEFAULT_BLOCK_MINUTES = get_int("AGGREGATE_BLOCK_MINUTES", 60)
+# Fechamento paralelo dos novos tickets. Desligado por padrão: close_position_full
+# pode alternar o AutoTrading (liga/fecha/desliga) e a API do MT5 não garante thread-safety.
+PARALLEL_CLOSE = get_bool("AGGREGATE_PARALLEL_CLOSE", False)
+PARALLEL_CLOSE_MAX_WORKERS = 8
+
+# Último estado montado (snapshot + diário), válido enquanto (mtime_ns, size) dos dois arquivos não mudar
+_STATE_CACHE: Dict[str, Any] = {"key": None, "data": None}
+# (monotonic, estado) deixado pelo último enforce_aggregate_risk
+_LAST_STATE_CACHE: tuple[float, Dict[str, Any]] | None = None
 
 # ---------------------------
 # Estado persistente simples
 # ---------------------------
+def _dumps(d: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(d, option=orjson.OPT_INDENT_2) if STATE_PRETTY else orjson.dumps(d)
+    if STATE_PRETTY:
+        return json.dumps(d, ensure_ascii=False, indent=2).encode("utf-8")
+    return json.dumps(d, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _dumps_line(d: Dict[str, Any]) -> bytes:
+    # sempre compacto: uma entrada por linha no diário
+    if orjson is not None:
+        return orjson.dumps(d, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(d, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+def _loads(raw: bytes) -> Any:
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+def _file_key(path: str):
+    try:
+        stt = os.stat(path)
+    except OSError:
+        return None
+    return (stt.st_mtime_ns, stt.st_size)
+
+def _state_key():
+    return (_file_key(STATE_FILE), _file_key(STATE_LOG))
+
+def _cache_state(d: Dict[str, Any]) -> None:
+    _STATE_CACHE.update(key=_state_key(), data=copy.deepcopy(d))
+
+def _apply_delta(d: Dict[str, Any], delta: Dict[str, Any]) -> None:
+    # Idempotente: reaplicar uma linha já consolidada no snapshot não altera o estado
+    if "add" in delta or "remove" in delta:
+        removed = set(int(x) for x in (delta.get("remove") or []))
+        base = [int(x) for x in (d.get("baseline_tickets") or []) if int(x) not in removed]
+        present = set(base)
+        for x in delta.get("add") or []:
+            x = int(x)
+            if x not in present:
+                base.append(x)
+                present.add(x)
+        d["baseline_tickets"] = base
+    for k, v in (delta.get("set") or {}).items():
+        d[k] = v
+
+def _state_delta(prev: Dict[str, Any], st: Dict[str, Any]) -> Dict[str, Any]:
+    delta: Dict[str, Any] = {}
+    old = set(int(x) for x in (prev.get("baseline_tickets") or []))
+    new = set(int(x) for x in (st.get("baseline_tickets") or []))
+    if new - old:
+        delta["add"] = [int(x) for x in st["baseline_tickets"] if int(x) not in old]
+    if old - new:
+        delta["remove"] = [x for x in old if x not in new]
+    changed = {k: v for k, v in st.items() if k != "baseline_tickets" and prev.get(k) != v}
+    if changed:
+        delta["set"] = changed
+    return delta
+
 def _load_state() -> Dict[str, Any]:
-    if not os.path.exists(STATE_FILE):
+    key = _state_key()
+    if key == (None, None):
         return {}
+    if _STATE_CACHE["data"] is not None and key == _STATE_CACHE["key"]:
+        return copy.deepcopy(_STATE_CACHE["data"])
+    # bytes direto para o parser (sem camada de decodificação de texto);
+    # os arquivos podem sumir entre o stat e o open
     try:
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(STATE_FILE, "rb") as f:
+            d = _loads(f.read())
+    except FileNotFoundError:
+        d = {}
     except Exception:
         return {}
+    # Replay do diário; uma linha final incompleta (queda no meio do append) é descartada
+    try:
+        with open(STATE_LOG, "rb") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        lines = []
+    lines = [ln for ln in lines if ln.strip()]
+    torn = False
+    for i, line in enumerate(lines):
+        try:
+            _apply_delta(d, _loads(line))
+        except Exception as e:
+            if i == len(lines) - 1:
+                torn = True  # só a última linha pode ser escrita pela metade
+                break
+            # linha corrompida no meio: registra e segue com os deltas válidos seguintes
+            log_event("ERROR", {"error": "linha inválida no diário de estado", "line": i + 1,
+                                "detail": repr(e)}, context={"module": "limits"})
+    if torn:
+        # compacta já: o próximo append não pode cair colado na linha quebrada
+        try:
+            _save_state(d)
+        except Exception:
+            pass
+        return d
+    _STATE_CACHE.update(key=key, data=copy.deepcopy(d))
+    return d
 
 def _save_state(d: Dict[str, Any]) -> None:
-    with open(STATE_FILE, "w", encoding="utf-8") as f:
-        json.dump(d, f, ensure_ascii=False, indent=2)
+    # Compactação: snapshot completo (baseline ordenado só aqui) num .tmp com um único
+    # write + fsync e troca atômica; depois descarta o diário já consolidado.
+    snap = dict(d)
+    snap["baseline_tickets"] = sorted(int(x) for x in (d.get("baseline_tickets") or []))
+    data = _dumps(snap)
+    tmp = STATE_FILE + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp, STATE_FILE)
+    try:
+        os.remove(STATE_LOG)
+    except FileNotFoundError:
+        pass
+    _cache_state(snap)
+
+def _append_state_log(delta: Dict[str, Any]) -> int:
+    # Uma linha por commit: o volume gravado é o do delta, não o do estado inteiro
+    line = _dumps_line(delta)
+    fd = os.open(STATE_LOG, os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o644)
+    try:
+        os.write(fd, line)
+        os.fsync(fd)
+        return os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+def _commit_state(st: Dict[str, Any], prev: Dict[str, Any]) -> None:
+    """Persiste só o que mudou em relação a prev: uma linha no diário, ou snapshot ao compactar."""
+    global _LAST_STATE_CACHE
+    # mesmo sem gravar, st é o estado vigente: fica disponível para risk_block_status
+    _LAST_STATE_CACHE = (time.monotonic(), dict(st))
+    if not os.path.exists(STATE_FILE):
+        _save_state(st)
+        return
+    delta = _state_delta(prev, st)
+    if not delta:
+        return
+    if _append_state_log(delta) > STATE_LOG_COMPACT_BYTES:
+        _save_state(st)
+    else:
+        _cache_state(st)
 
 def _now_utc():
-    return datetime.utcnow().replace(tzinfo=pytz.UTC)
+    return datetime.now(timezone.utc)
 
 def _from_iso_any(v: Any):
     if not isinstance(v, str) or not v.strip():
@@ -64,12 +216,23 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
 
     Retorna um relatório com estado e ações tomadas.
     """
+    # um único "agora" por chamada: expiração, last_attempt_at e kill-switch usam o mesmo instante
+    now = _now_utc()
+    now_iso = now.isoformat()
+
     snap = reader.snapshot()
     total = float(snap["exposure"]["total_risk_pct"])
-    tickets_current: Set[int] = {int(p["ticket"]) for p in snap["positions"]}
+    # uma única passada: conjunto de tickets + índice ticket -> posição (usado no fechamento)
+    tickets_current: Set[int] = set()
+    by_ticket: Dict[int, Dict[str, Any]] = {}
+    for p in snap["positions"]:
+        t = int(p["ticket"])
+        tickets_current.add(t)
+        by_ticket[t] = p
 
-    st = _load_state()
-    baseline: List[int] = st.get("baseline_tickets") or []
+    prev = _load_state()
+    st = dict(prev)
+    baseline: List[int] = [int(x) for x in (st.get("baseline_tickets") or [])]
     attempts: int = int(st.get("block_attempts", 0))
     last_attempt_at = _from_iso_any(st.get("last_attempt_at"))
 
@@ -81,14 +244,14 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
     # Evita carregar tentativa antiga por tempo indefinido:
     # se ficou sem novas violações por "block_minutes", zera o contador.
     if attempts > 0 and last_attempt_at is not None:
-        idle_sec = (_now_utc() - last_attempt_at).total_seconds()
+        idle_sec = (now - last_attempt_at).total_seconds()
         if idle_sec >= max(1, int(block_minutes)) * 60:
             attempts = 0
             st["block_attempts"] = 0
             st["last_attempt_at"] = None
 
     report: Dict[str, Any] = {
-        "now_utc": _now_utc().isoformat(),
+        "now_utc": now_iso,
         "threshold_pct": threshold_pct,
         "total_risk_pct": total,
         "positions": len(tickets_current),
@@ -110,10 +273,10 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
 
     # Primeira execução: cria baseline e não fecha nada
     if not baseline:
-        st["baseline_tickets"] = sorted(list(tickets_current))
+        st["baseline_tickets"] = list(by_ticket)
         st["block_attempts"] = attempts
         st["risk_block_active"] = risk_block_active
-        _save_state(st)
+        _commit_state(st, prev)
         report["baseline_tickets"] = st["baseline_tickets"]
         report["attempts_after"] = attempts
         report["risk_block_active_after"] = risk_block_active
@@ -127,32 +290,39 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
             attempts = 0
             st["last_attempt_at"] = None
             risk_block_active = False
-        st["baseline_tickets"] = sorted(list(tickets_current))
+        st["baseline_tickets"] = list(by_ticket)
         st["block_attempts"] = attempts
         st["risk_block_active"] = risk_block_active
-        _save_state(st)
+        _commit_state(st, prev)
         report["baseline_tickets"] = st["baseline_tickets"]
         report["attempts_after"] = attempts
         report["risk_block_active_after"] = risk_block_active
         return report
 
     # Risco agregado excedido -> fechar apenas NOVOS tickets
-    baseline_set = set(int(x) for x in baseline)
-    new_tickets = [t for t in tickets_current if t not in baseline_set]
+    baseline_set = frozenset(baseline)
+    new_tickets = [t for t in by_ticket if t not in baseline_set]
     report["new_tickets_detected"] = new_tickets
 
     # Fecha cada novo ticket detectado
-    for pos in snap["positions"]:
-        t = int(pos["ticket"])
-        if t not in new_tickets:
-            continue
-        ok, res = close_position_full(
+    def _close(t: int):
+        pos = by_ticket[t]
+        return close_position_full(
             ticket=t,
             symbol=pos["symbol"],
             side=pos["type"],
             volume=float(pos["volume"]),
             comment="RG aggblock"
         )
+
+    if PARALLEL_CLOSE and len(new_tickets) > 1:
+        with ThreadPoolExecutor(max_workers=min(PARALLEL_CLOSE_MAX_WORKERS, len(new_tickets))) as ex:
+            results = list(ex.map(_close, new_tickets))  # mantém a ordem dos tickets no relatório
+    else:
+        results = [_close(t) for t in new_tickets]
+
+    for t, (ok, res) in zip(new_tickets, results):
+        pos = by_ticket[t]
         if ok:
             report["closed"].append({"ticket": t, "symbol": pos["symbol"], "result": res})
         else:
@@ -161,7 +331,7 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
     # Contabiliza tentativas (1 por novo ticket detectado)
     if new_tickets:
         attempts += len(new_tickets)
-        st["last_attempt_at"] = _now_utc().isoformat()
+        st["last_attempt_at"] = now_iso
     st["block_attempts"] = attempts
     report["attempts_after"] = attempts
 
@@ -169,7 +339,7 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
     if attempts >= max_block_attempts:
         risk_block_active = True
         if not kill_active_before:
-            until = _now_utc() + timedelta(minutes=max(1, int(block_minutes)))
+            until = now + timedelta(minutes=max(1, int(block_minutes)))
             try:
                 set_kill_until(until)
                 ks_after = kill_status()
@@ -180,11 +350,8 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
                 report["kill_switch_active_after"] = False
                 report["kill_switch_until_after"] = None
 
-    # Se não armou kill agora, mantém o status atual observado
-    if not report["kill_switch_armed_now"]:
-        ks_after = kill_status()
-        report["kill_switch_active_after"] = bool(ks_after.get("active"))
-        report["kill_switch_until_after"] = ks_after.get("until")
+    # Se não armou kill agora, o status observado no início (ks_before) continua válido:
+    # o relatório já nasce com esses valores, sem reler o estado do kill-switch.
 
     # Enquanto kill_switch estiver ativo, bloqueio de risco é considerado ativo
     if report["kill_switch_active_after"]:
@@ -194,17 +361,21 @@ def enforce_aggregate_risk(reader: RiskGuardMT5Reader,
     report["risk_block_active_after"] = risk_block_active
 
     # baseline permanece como o conjunto original (não inclui os novos bloqueados)
-    _save_state(st)
+    _commit_state(st, prev)
     return report
 
 def risk_block_status() -> Dict[str, Any]:
     """Consulta estado do bloqueio lógico de risco agregado."""
-    st = _load_state()
+    cached = _LAST_STATE_CACHE
+    if cached is not None and (time.monotonic() - cached[0]) < LAST_STATE_MAX_AGE_S:
+        st = cached[1]
+    else:
+        st = _load_state()
     ks = kill_status()
     return {
         "risk_block_active": bool(st.get("risk_block_active", False)) or bool(ks.get("active")),
         "block_attempts": int(st.get("block_attempts", 0)),
-        "baseline_tickets": st.get("baseline_tickets", []),
+        "baseline_tickets": sorted(int(x) for x in (st.get("baseline_tickets") or [])),
         "kill_switch_active": bool(ks.get("active")),
         "kill_switch_until": ks.get("until"),
     }
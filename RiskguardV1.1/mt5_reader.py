@@ -3,7 +3,7 @@
 from __future__ import annotations
 
 import time
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Set, Tuple
 import MetaTrader5 as mt5
 from datetime import datetime, timedelta, timezone
 
@@ -118,6 +118,15 @@ class RiskGuardMT5Reader:
             "server": acc.server
         }
 
+    # ---- botão AutoTrading do terminal
+    def autotrading_enabled(self) -> Optional[bool]:
+        """True/False = estado do botão; None = terminal_info() falhou (estado desconhecido)."""
+        self.ensure_connection()
+        info = mt5.terminal_info()
+        if info is None:
+            return None
+        return bool(info.trade_allowed)
+
     # ---- símbolo
     def _read_symbol_info(self, symbol: str) -> Dict[str, Any]:
         info = mt5.symbol_info(symbol)
@@ -272,6 +281,30 @@ class RiskGuardMT5Reader:
 
         return positions, exposure_by_symbol
 
+    # ---- tickets abertos (leitura leve: sem símbolos, ticks ou deals)
+    def read_tickets(self) -> Set[int]:
+        self.ensure_connection()
+        raw_positions = mt5.positions_get()
+        if raw_positions is None:
+            # sessão pode ter sido encerrada por fora (ex.: mt5.shutdown do kill_switch): reconecta na próxima
+            self._connected = False
+            raise RuntimeError("Não foi possível ler positions_get().")
+        return {int(p.ticket) for p in raw_positions}
+
+    # ---- quais destes tickets ainda estão abertos (positions_get por ticket)
+    def positions_alive(self, tickets: Set[int]) -> Set[int]:
+        self.ensure_connection()
+        alive: Set[int] = set()
+        for t in tickets:
+            res = mt5.positions_get(ticket=int(t))
+            # None = erro de IPC (não dá para afirmar que fechou); () = ticket não existe mais
+            if res is None:
+                self._connected = False
+                raise RuntimeError(f"Não foi possível ler positions_get(ticket={int(t)}).")
+            if res:
+                alive.add(int(t))
+        return alive
+
     # ---- snapshot completo (saída única para as próximas funções)
     def snapshot(self) -> Dict[str, Any]:
         acc = self.read_account()
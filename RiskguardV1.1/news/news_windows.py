@@ -1,9 +1,18 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Set
-from datetime import datetime, timedelta
-import os, sys, time, json, argparse
+from typing import Any, Callable, Dict, FrozenSet, List, Set, Tuple
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import os, sys, time, json, argparse, asyncio, heapq, itertools, threading
+import numpy as np
 import pandas as pd
-import pytz
+
+UTC = timezone.utc
+
+try:
+    import orjson  # parser nativo (opcional); sem ele usa o json da stdlib
+except ImportError:
+    orjson = None
 
 
 # ---------- Ajuste de PATH para enxergar a raiz do projeto ----------
@@ -24,11 +33,22 @@ from limits.uia import ensure_autotrading_on, ensure_autotrading_off
 
 
 CACHE_FILE = os.path.join(HERE, "ff_cache.json")
+CALENDAR_DTYPES = {"currency": "category", "importance": "category", "event": "string"}
 DEBUG_MODE = True
+TRACE_MODE = False  # log detalhado por posição (muito verboso)
 LAST_AUTOTRADE_REENABLE = 0.0
+# Prazos pendentes (epoch, seq, ação), ordenados por heapq: o daemon só olha o topo
+_deadlines: List[Tuple[float, int, Callable[[], Any]]] = []
+_deadlines_lock = threading.Lock()
+_deadline_seq = itertools.count()
+_reenable_at: float | None = None  # prazo mais tardio já agendado para _reenable_autotrade
 LAST_CALENDAR_UPDATE_DAY = None  # <- novo
 DEFAULT_NEWS_WINDOW_MINUTES = get_int("NEWS_WINDOW_MINUTES", 60)
 DEFAULT_NEWS_RECENT_SECONDS = get_optional_int("NEWS_RECENT_SECONDS", None)
+POSITION_WATCH_INTERVAL_S = 0.25
+# Toda chamada MT5/UIA do daemon passa por esta única thread: a API do MetaTrader5 é uma
+# sessão global e não é thread-safe (kill_switch faz initialize/shutdown nela).
+_MT5_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rg-mt5")
 
 # Offset fixo entre UTC e horário do servidor da corretora.
 # Exemplo: se no MT5 aparecer:
@@ -36,45 +56,130 @@ DEFAULT_NEWS_RECENT_SECONDS = get_optional_int("NEWS_RECENT_SECONDS", None)
 #   TimeGMT        = 17:17
 # então o servidor está em UTC+2 -> use 2 aqui.
 BROKER_UTC_OFFSET_HOURS = 2  # <-- AJUSTA AQUI depois de ver no MT5
+OFFSET_S = BROKER_UTC_OFFSET_HOURS * 3600
+
+
+def debug(msg: str, now_ts: float | None = None):
+    """now_ts: epoch já calculado pelo chamador (evita reler o relógio em loops)."""
+    if not DEBUG_MODE:
+        return
+    # timestamp do LOG no horário da corretora (server), com offset fixo em relação ao UTC
+    if now_ts is None:
+        now_ts = time.time()
+    ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now_ts + OFFSET_S))
+    print(f"[NEWS_DEBUG] {ts} | {msg}", flush=True)
+
+
+# ============================================================
+# Prazos (kill-switch): fila de prioridade em vez de polling
+# ============================================================
+def schedule_deadline(deadline_ts: float, action: Callable[[], Any]) -> None:
+    with _deadlines_lock:
+        heapq.heappush(_deadlines, (float(deadline_ts), next(_deadline_seq), action))
+
+
+def schedule_reenable(deadline_ts: float) -> None:
+    """Agenda _reenable_autotrade só se o prazo for mais tardio que o já agendado (a varredura repete o enforce)."""
+    global _reenable_at
+    deadline_ts = float(deadline_ts)
+    with _deadlines_lock:
+        # folga de 0,5 s: o mesmo "until" recalculado via remaining_sec não vira entrada duplicada
+        if _reenable_at is not None and deadline_ts <= _reenable_at + 0.5:
+            return
+        _reenable_at = deadline_ts
+    schedule_deadline(deadline_ts, _reenable_autotrade)
+
+
+def _pop_due_deadlines(now_ts: float) -> List[Callable[[], Any]]:
+    due = []
+    with _deadlines_lock:
+        while _deadlines and _deadlines[0][0] <= now_ts:
+            due.append(heapq.heappop(_deadlines)[2])
+    return due
+
 
+def _next_deadline_ts() -> float | None:
+    with _deadlines_lock:
+        return _deadlines[0][0] if _deadlines else None
 
-def debug(msg: str):
-    if DEBUG_MODE:
-        # agora o timestamp do LOG vai sair no horário da corretora (server),
-        # usando um offset fixo em relação ao UTC
-        now_utc = datetime.utcnow().replace(tzinfo=pytz.UTC)
-        server_time = now_utc + timedelta(hours=BROKER_UTC_OFFSET_HOURS)
-        ts = server_time.strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[NEWS_DEBUG] {ts} | {msg}", flush=True)
+
+def _reenable_autotrade():
+    """Ação do prazo do kill-switch: religa o AutoTrade ou reagenda se ainda não deu."""
+    global LAST_AUTOTRADE_REENABLE
+    if maybe_reenable_autotrade():
+        LAST_AUTOTRADE_REENABLE = time.time()
+        return
+    ks = kill_status()
+    if ks["active"]:
+        # prazo foi estendido (ex.: nova notícia) → agenda no novo horário
+        schedule_reenable(time.time() + ks["remaining_sec"])
+    elif ks["until"] is not None:
+        # expirou, mas o toggle falhou: tenta de novo em instantes
+        schedule_reenable(time.time() + 3)
+
+
+# ============================================================
+# Calendário indexado por horário
+# ============================================================
+class CalendarIndex:
+    """
+    Calendário pré-processado para consultas rápidas de janela.
+    - ts_ns: horários UTC em int64 (ns), ordenados -> busca binária (np.searchsorted)
+    - currency_codes: códigos inteiros da coluna categórica currency, alinhados com ts_ns
+    - code_of: moeda -> código
+    - records: eventos como dict, prontos para o relatório
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.ts_ns = df["ts_utc"].to_numpy(dtype="datetime64[ns]").view("i8")
+        cats = df["currency"].cat.categories
+        self.currency_codes = df["currency"].cat.codes.to_numpy()
+        self.code_of: Dict[str, int] = dict(zip(cats, range(len(cats))))
+        self.records: List[Dict[str, Any]] = df.to_dict("records")
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def window_open(self, now_utc: datetime, window_min: int) -> bool:
+        """Existe evento (de qualquer moeda) dentro de ±window_min de agora?"""
+        win_ns = int(window_min) * 60 * 1_000_000_000
+        now_ns = pd.Timestamp(now_utc).value
+        i = int(np.searchsorted(self.ts_ns, now_ns - win_ns, "left"))
+        return i < len(self.ts_ns) and int(self.ts_ns[i]) <= now_ns + win_ns
+
+    def next_window_start(self, now_utc: datetime, window_min: int) -> datetime | None:
+        """Próximo instante (UTC) em que a janela de algum evento abre (ts_utc - window_min)."""
+        win_ns = int(window_min) * 60 * 1_000_000_000
+        now_ns = pd.Timestamp(now_utc).value
+        i = int(np.searchsorted(self.ts_ns, now_ns + win_ns, "right"))
+        if i >= len(self.ts_ns):
+            return None
+        return pd.Timestamp(int(self.ts_ns[i]) - win_ns, tz="UTC").to_pydatetime()
 
 
 # ============================================================
 # Ler o cache local do ForexFactory
 # ============================================================
-def load_cached_calendar(max_age_days: int = 7) -> pd.DataFrame | None:
+def load_cached_calendar(max_age_days: int = 7) -> CalendarIndex | None:
     if not os.path.exists(CACHE_FILE):
         debug("Cache inexistente. Rode update_news.py primeiro.")
         return None
     try:
-        data = json.load(open(CACHE_FILE, "r", encoding="utf-8"))
+        with open(CACHE_FILE, "rb") as f:
+            raw = f.read()
+        data = orjson.loads(raw) if orjson is not None else json.loads(raw)
         rows = data.get("events", [])
-        for r in rows:
-            if r.get("ts_utc"):
-                r["ts_utc"] = datetime.fromisoformat(r["ts_utc"])
         df = pd.DataFrame(rows)
         if df.empty:
             debug("Cache vazio.")
             return None
+        # tipos estreitos: moeda/impacto como categoria (códigos int8), texto como string
+        df = df.astype({k: v for k, v in CALENDAR_DTYPES.items() if k in df.columns})
+        # ISO-8601 em lote (sem fromisoformat linha a linha)
         df["ts_utc"] = pd.to_datetime(df["ts_utc"], utc=True)
+        df = df.dropna(subset=["ts_utc"]).sort_values("ts_utc").reset_index(drop=True)
         debug(f"Cache carregado: {len(df)} eventos.")
-        for _, r in df.iterrows():
-            ts_utc = r["ts_utc"]
-            ts_server = ts_utc + timedelta(hours=BROKER_UTC_OFFSET_HOURS)
-            debug(
-                f"Evento: {r['currency']} | {r['event']} | "
-                f"{ts_utc} (UTC) -> {ts_server} (SERVER)"
-            )
-        return df.sort_values("ts_utc")
+        return CalendarIndex(df)
     except Exception as e:
         debug(f"Erro lendo cache: {e!r}")
         return None
@@ -83,24 +188,45 @@ def load_cached_calendar(max_age_days: int = 7) -> pd.DataFrame | None:
 # ============================================================
 # Lógica principal de bloqueio
 # ============================================================
-def map_symbol_currencies(symbol: str) -> Set[str]:
+@lru_cache(maxsize=512)
+def map_symbol_currencies(symbol: str) -> FrozenSet[str]:
     s = (symbol or "").upper()
     if len(s) >= 6 and s[:3].isalpha() and s[3:6].isalpha():
-        return {s[:3], s[3:6]}
-    return {s[-3:]}
+        return frozenset((s[:3], s[3:6]))
+    return frozenset((s[-3:],))
+
+
+_NO_EVENTS = np.empty(0, dtype=np.intp)
 
 
-def find_events(df: pd.DataFrame, currencies: Set[str], now_utc: datetime, window_min: int = DEFAULT_NEWS_WINDOW_MINUTES):
-    if df is None or df.empty:
-        return []
-    lo = now_utc - timedelta(minutes=window_min)
-    hi = now_utc + timedelta(minutes=window_min)
-    return [r for _, r in df.iterrows() if r["currency"] in currencies and lo <= r["ts_utc"] <= hi]
+def find_event_idx(cal: CalendarIndex, currencies: Set[str], now_utc: datetime, window_min: int = DEFAULT_NEWS_WINDOW_MINUTES) -> np.ndarray:
+    """Índices (em cal.records / cal.ts_ns) dos eventos das moedas dentro de ±window_min."""
+    if cal is None or not len(cal):
+        return _NO_EVENTS
+    lo_ns = pd.Timestamp(now_utc - timedelta(minutes=window_min)).value
+    hi_ns = pd.Timestamp(now_utc + timedelta(minutes=window_min)).value
+    # ts_ns está ordenado: recorta só a fatia [lo, hi] antes de olhar as moedas
+    i0 = int(np.searchsorted(cal.ts_ns, lo_ns, "left"))
+    i1 = int(np.searchsorted(cal.ts_ns, hi_ns, "right"))
+    if i0 >= i1:
+        return _NO_EVENTS
+    wanted = np.fromiter(
+        (cal.code_of[c] for c in currencies if c in cal.code_of),
+        dtype=cal.currency_codes.dtype,
+    )
+    if not wanted.size:
+        return _NO_EVENTS
+    mask = np.isin(cal.currency_codes[i0:i1], wanted)
+    return i0 + np.nonzero(mask)[0]
+
+
+def find_events(cal: CalendarIndex, currencies: Set[str], now_utc: datetime, window_min: int = DEFAULT_NEWS_WINDOW_MINUTES) -> List[Dict[str, Any]]:
+    return [cal.records[i] for i in find_event_idx(cal, currencies, now_utc, window_min)]
 
 
 def enforce_news_window(
     reader: RiskGuardMT5Reader,
-    events_df: pd.DataFrame,
+    cal: CalendarIndex,
     window_min: int = DEFAULT_NEWS_WINDOW_MINUTES,
     recent_s: int | None = DEFAULT_NEWS_RECENT_SECONDS
 ):
@@ -111,14 +237,14 @@ def enforce_news_window(
     - recent_s: se informado, só tenta fechar ordens abertas nos últimos X segundos.
       Se None, usa automaticamente o tamanho da janela de notícias (window_min * 60).
     """
-    now_utc = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    now_utc = datetime.now(UTC)
 
     try:
         snap = reader.snapshot()
     except Exception:
         debug("MT5 indisponível (AutoTrade OFF ou terminal travado). Aguardando…")
         time.sleep(2)
-        return {"affected": [], "closed": [], "failed": [], "kill_switch_until": None}
+        return {"affected": [], "closed": [], "failed": [], "kill_switch_until": None, "error": "snapshot"}
 
     positions = snap.get("positions", [])
     report: Dict[str, Any] = {
@@ -127,16 +253,32 @@ def enforce_news_window(
         "failed": [],
         "kill_switch_until": None,
     }
-    max_kill_until: datetime | None = None
 
     age_limit_s = window_min * 60 if recent_s is None else recent_s
-
+    now_epoch = now_utc.timestamp()
+
+    # Busca no calendário uma vez por símbolo (várias posições costumam dividir o mesmo ativo).
+    # Os dicts de cal.records vão direto para o relatório: tratar como somente leitura.
+    symbol_to_idx: Dict[str, np.ndarray] = {}
+    symbol_to_matches: Dict[str, List[Dict[str, Any]]] = {}
+    for sym in {str(p.get("symbol", "")) for p in positions if isinstance(p, dict)}:
+        if not sym:
+            continue
+        ccy = map_symbol_currencies(sym)
+        debug(f"Moedas do ativo {sym}: {ccy}", now_epoch)
+        idx = find_event_idx(cal, ccy, now_utc, window_min)
+        symbol_to_idx[sym] = idx
+        symbol_to_matches[sym] = [cal.records[i] for i in idx]
+
+    # 1ª passada: só identifica o que precisa ser fechado
+    to_close: List[tuple] = []
     for pos in positions:
-        debug(f"Analisando posição recebida: {pos}")
+        if TRACE_MODE:
+            debug(f"Analisando posição recebida: {pos}", now_epoch)
         try:
             # --- Primeiro, validação básica ---
             if not isinstance(pos, dict):
-                debug("Ignorada — posição não é dict.")
+                debug("Ignorada — posição não é dict.", now_epoch)
                 continue
 
             # --- Obtém campos essenciais ---
@@ -146,35 +288,61 @@ def enforce_news_window(
             volume = float(pos.get("volume", 0.0))
 
             if not symbol:
-                debug("Ignorada — símbolo vazio.")
+                debug("Ignorada — símbolo vazio.", now_epoch)
                 continue
 
-            # --- CONVERSÃO DO HORÁRIO DA ORDEM (100% UTC) ---
-            open_time_raw = pos.get("open_time")
+            # --- IDADE DA ORDEM (100% UTC) ---
+            # Tratamos sempre como UTC, alinhado com MT5/ticks e calendário.
+            # Caminho rápido: epoch inteiro do MT5; só faz parse se vier texto.
+            open_time_raw = pos.get("open_time_epoch") or pos.get("open_time")
             if not open_time_raw:
-                debug("Ignorada — open_time ausente.")
+                debug("Ignorada — open_time ausente.", now_epoch)
                 continue
 
-            # Tratamos sempre como UTC, alinhado com MT5/ticks e calendário
-            open_time = pd.to_datetime(open_time_raw, utc=True)
+            if isinstance(open_time_raw, (int, float)):
+                age_s = now_epoch - float(open_time_raw)
+            else:
+                age_s = now_epoch - pd.to_datetime(open_time_raw, utc=True).timestamp()
 
-            debug(f"Horário bruto da ordem: {open_time_raw}")
-            debug(f"Horário UTC convertido: {open_time}")
+            debug(f"Horário da ordem: {open_time_raw} (idade {age_s:.0f}s)", now_epoch)
 
             # posição só é filtrada por idade se age_limit_s estiver definido
-            if (age_limit_s is not None) and (now_utc - open_time).total_seconds() > age_limit_s:
-                debug(f"Ignorada — ordem antiga demais (>{age_limit_s}s).")
+            if (age_limit_s is not None) and age_s > age_limit_s:
+                debug(f"Ignorada — ordem antiga demais (>{age_limit_s}s).", now_epoch)
                 continue
 
             # --- DETECÇÃO DE NOTÍCIA ---
-            ccy = map_symbol_currencies(symbol)
-            debug(f"Moedas do ativo {symbol}: {ccy}")
-            matches = find_events(events_df, ccy, now_utc, window_min)
+            matches = symbol_to_matches.get(symbol, [])
             if not matches:
                 continue
 
+            to_close.append((ticket, symbol, side, volume, matches))
+
+        except Exception as e:
+            debug(f"Erro enforce: {repr(e)}", now_epoch)
+            continue
+
+    # Com AutoTrading OFF (ex.: kill-switch ativo), liga UMA vez para o lote inteiro
+    # em vez de close_position_full alternar o botão a cada posição.
+    toggled_on = False
+    if to_close:
+        try:
+            # Ctrl+E alterna o botão: só envia com leitura definitiva de OFF.
+            # None (leitura falhou) deixa close_position_full tratar posição a posição.
+            at_enabled = reader.autotrading_enabled()
+            if at_enabled is False:
+                debug("Garantindo AutoTrading ON para fechar o lote…")
+                toggled_on = ensure_autotrading_on()
+                time.sleep(0.4)
+            elif at_enabled is None:
+                debug("Estado do AutoTrading desconhecido (terminal_info falhou); sem toggle do lote.")
+        except Exception as e:
+            debug(f"Erro ao ligar AutoTrading: {e!r}")
+
+    # 2ª passada: fecha
+    for ticket, symbol, side, volume, matches in to_close:
+        try:
             debug(f"Fechando {symbol} ticket={ticket} devido a notícia.")
-            debug(f"Tentando fechar ordem via close_position_full()…")
 
             ok, res = close_position_full(ticket, symbol, side, volume, comment="RG NewsBlock")
 
@@ -183,15 +351,11 @@ def enforce_news_window(
             else:
                 report["failed"].append({"ticket": ticket, "symbol": symbol, "res": res})
 
-            until = max(m["ts_utc"] for m in matches) + timedelta(minutes=window_min)
-            if (max_kill_until is None) or (until > max_kill_until):
-                max_kill_until = until
-
             report["affected"].append(
                 {
                     "ticket": ticket,
                     "symbol": symbol,
-                    "matches": [dict(m) for m in matches],
+                    "matches": matches,
                 }
             )
 
@@ -199,8 +363,21 @@ def enforce_news_window(
             debug(f"Erro enforce: {repr(e)}")
             continue
 
-    if report["affected"] and max_kill_until is not None:
+    # devolve o botão ao estado anterior ao lote (como close_position_full fazia por posição)
+    if toggled_on:
+        ensure_autotrading_off()
+
+    # Kill-switch até o fim da janela do evento mais tardio entre os ativos afetados:
+    # calculado uma vez por símbolo e gravado uma única vez por lote.
+    affected_symbols = {a["symbol"] for a in report["affected"]}
+    max_kill_until = None
+    if affected_symbols:
+        affected_idx = np.concatenate([symbol_to_idx[sym] for sym in affected_symbols])
+        max_ns = int(cal.ts_ns[affected_idx].max())
+        max_kill_until = pd.Timestamp(max_ns, tz="UTC") + timedelta(minutes=window_min)
+    if max_kill_until is not None:
         set_kill_until(max_kill_until)
+        schedule_reenable(max_kill_until.timestamp())
         debug(f"AutoTrade pausado até {max_kill_until} (kill-switch).")
         report["kill_switch_until"] = max_kill_until.isoformat()
 
@@ -213,11 +390,12 @@ def enforce_news_window(
 def auto_update_calendar():
     """
     Roda update_news.py automaticamente 1x por domingo (horário UTC).
+    Chama update_news.main() no próprio processo; subprocess só como fallback.
     """
     import subprocess  # importa local para não mexer nos imports globais
     global LAST_CALENDAR_UPDATE_DAY
 
-    now_utc = datetime.utcnow()
+    now_utc = datetime.now(UTC)
     today = now_utc.date()
     weekday = today.weekday()  # 0=segunda, 6=domingo
 
@@ -225,157 +403,273 @@ def auto_update_calendar():
     if weekday == 6 and LAST_CALENDAR_UPDATE_DAY != today:
         updater = os.path.join(HERE, "update_news.py")
 
-        if os.path.exists(updater):
-            print("[AUTOUPDATE] Domingo detectado — atualizando calendário ForexFactory...")
-            try:
-                subprocess.run([sys.executable, updater], check=False)
-                LAST_CALENDAR_UPDATE_DAY = today
-                print("[AUTOUPDATE] Atualização concluída.")
-            except Exception as e:
-                print(f"[AUTOUPDATE] Erro ao rodar update_news.py: {e!r}")
-        else:
+        try:
+            from news import update_news
+        except Exception:
+            update_news = None
+
+        if update_news is None and not os.path.exists(updater):
             print("[AUTOUPDATE] update_news.py não encontrado.")
+            return
+
+        print("[AUTOUPDATE] Domingo detectado — atualizando calendário ForexFactory...")
+        try:
+            if update_news is not None:
+                update_news.main()
+            else:
+                subprocess.run([sys.executable, updater], check=False)
+            LAST_CALENDAR_UPDATE_DAY = today
+            print("[AUTOUPDATE] Atualização concluída.")
+        except Exception as e:
+            print(f"[AUTOUPDATE] Erro ao rodar update_news.py: {e!r}")
 
 
 # ============================================================
-# Daemon: monitora continuamente
+# Daemon (asyncio): acorda por evento, não por intervalo fixo
 # ============================================================
-def run_daemon(mt5_path: str, poll_s: int = 3, cal_refresh_min: int = 10):
-    global LAST_AUTOTRADE_REENABLE
-    debug(f"Iniciando monitor de notícias (MT5={mt5_path})")
-    reader = RiskGuardMT5Reader(path=mt5_path)
-    if not reader.connect():
-        debug("Falha ao conectar MT5.")
-        sys.exit(2)
+def _merge_reports(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
+    """Acumula listas sem duplicar tickets e mantém kill_switch_until máximo."""
+    def _merge_list(key: str):
+        existing = {(i.get("ticket"), i.get("symbol")) for i in base.get(key, [])}
+        for item in extra.get(key, []) or []:
+            k = (item.get("ticket"), item.get("symbol"))
+            if k not in existing:
+                base.setdefault(key, []).append(item)
+                existing.add(k)
+
+    _merge_list("affected")
+    _merge_list("closed")
+    _merge_list("failed")
+
+    def _parse_iso(x):
+        try:
+            return datetime.fromisoformat(x) if x else None
+        except Exception:
+            return None
 
-    last_load = 0.0
-    events_df: pd.DataFrame | None = None
+    main_until = _parse_iso(base.get("kill_switch_until"))
+    extra_until = _parse_iso(extra.get("kill_switch_until"))
+    if extra_until and (not main_until or extra_until > main_until):
+        base["kill_switch_until"] = extra.get("kill_switch_until")
+    return base
 
-    def _merge_reports(base: Dict[str, Any], extra: Dict[str, Any]) -> Dict[str, Any]:
-        """Acumula listas sem duplicar tickets e mantém kill_switch_until máximo."""
-        def _merge_list(key: str):
-            existing = {(i.get("ticket"), i.get("symbol")) for i in base.get(key, [])}
-            for item in extra.get(key, []) or []:
-                k = (item.get("ticket"), item.get("symbol"))
-                if k not in existing:
-                    base.setdefault(key, []).append(item)
-                    existing.add(k)
 
-        _merge_list("affected")
-        _merge_list("closed")
-        _merge_list("failed")
+def _reload_calendar_if_changed(holder: Dict[str, Any]) -> bool:
+    """Recarrega o cache só quando o arquivo mudar (mtime). Retorna True se recarregou."""
+    try:
+        mtime = os.stat(CACHE_FILE).st_mtime
+    except FileNotFoundError:
+        mtime = 0.0
+    if mtime == holder.get("mtime"):
+        return False
+    holder["cal"] = load_cached_calendar()
+    holder["mtime"] = mtime
+    return True
+
 
-        def _parse_iso(x):
+def _enforce_once(reader: RiskGuardMT5Reader, cal: CalendarIndex | None) -> bool:
+    """
+    Uma passada completa (bloqueante, roda em thread): bloqueio e varredura.
+    O reengate do AutoTrade fica a cargo dos prazos agendados (watch_kill).
+    Retorna False se o MT5 não respondeu (o daemon agenda nova tentativa).
+    """
+    debug("Loop vivo… verificando notícias e ordens.")
+
+    # 1 — Anti-flood: aguardar MT5 voltar ao normal após religar AutoTrade
+    since = time.time() - LAST_AUTOTRADE_REENABLE
+    if LAST_AUTOTRADE_REENABLE and since < 3:
+        debug("Aguardando MT5 estabilizar após religar AutoTrade…")
+        time.sleep(3 - since)
+
+    if cal is None:
+        return True
+
+    # 2 — Aplica a lógica de bloqueio de notícias
+    report = enforce_news_window(reader, cal)
+    if report.get("error"):
+        return False
+
+    # Se houve ordens afetadas, varrer continuamente durante a janela
+    # para garantir que nenhuma nova ordem permaneça aberta no evento.
+    if report and report.get("affected"):
+        debug("Notícia detectada — iniciando varredura contínua até limpar tudo…")
+        consolidated = dict(report)
+        window_min = DEFAULT_NEWS_WINDOW_MINUTES  # mesmo valor padrão usado no enforce
+
+        while True:
+            # Fecha novamente caso novas ordens apareçam na janela
             try:
-                return datetime.fromisoformat(x) if x else None
+                extra = enforce_news_window(reader, cal, window_min=window_min)
+                consolidated = _merge_reports(consolidated, extra)
+            except Exception as e:
+                debug(f"Erro ao varrer novas ordens durante evento: {e!r}")
+
+            affected_tickets = {int(a["ticket"]) for a in consolidated.get("affected", [])}
+            try:
+                # consulta leve: só verifica se os tickets afetados ainda existem
+                remaining = reader.positions_alive(affected_tickets)
             except Exception:
-                return None
+                debug("MT5 indisponível enquanto aguarda fechamento… tentando de novo…")
+                time.sleep(2)
+                continue
 
-        main_until = _parse_iso(base.get("kill_switch_until"))
-        extra_until = _parse_iso(extra.get("kill_switch_until"))
-        if extra_until and (not main_until or extra_until > main_until):
-            base["kill_switch_until"] = extra.get("kill_switch_until")
-        return base
+            if not remaining:
+                break
 
-    while True:
-        debug("Loop vivo… verificando notícias e ordens.")
+            debug(f"Aguardando... ordens de notícia ainda abertas: {remaining}")
+            time.sleep(1)
 
-        # 1 — REENGATE DO AUTOTRADE (usar o kill_switch oficial)
-        state = kill_status()
+        debug("Todas as ordens afetadas pela notícia foram encerradas.")
+        debug("Desligando AutoTrade (uia.py)…")
+        ensure_autotrading_off()
 
-        # Só tenta religar SE existe kill configurado no JSON
-        if state["until"] is not None:
-            reenabled = maybe_reenable_autotrade()
-            if reenabled:
-                LAST_AUTOTRADE_REENABLE = time.time()
+        # Aviso no Telegram DEPOIS de tudo estar encerrado
+        debug("Enviando relatório de notícia para o Telegram…")
+        notify_news(consolidated)
+    return True
 
-        # 2 — Anti-flood: aguardar MT5 voltar ao normal após religar AutoTrade
-        if LAST_AUTOTRADE_REENABLE and time.time() - LAST_AUTOTRADE_REENABLE < 3:
-            debug("Aguardando MT5 estabilizar após religar AutoTrade…")
-            time.sleep(1)
+
+async def _mt5_call(fn: Callable[..., Any], *args: Any) -> Any:
+    """Executa fn na thread dedicada do MT5 (serializa com enforce e prazos)."""
+    return await asyncio.get_running_loop().run_in_executor(_MT5_EXECUTOR, fn, *args)
+
+
+async def watch_positions(reader: RiskGuardMT5Reader, wake: asyncio.Event, busy: asyncio.Event,
+                          interval_s: float = POSITION_WATCH_INTERVAL_S):
+    """Lê só os tickets abertos e acorda o daemon quando o conjunto muda (1ª leitura sempre acorda)."""
+    last_hash: int | None = None
+    while True:
+        if busy.is_set():
+            # passada de enforce em andamento: não disputa o MT5 com ela
+            await asyncio.sleep(interval_s)
             continue
+        try:
+            h = hash(frozenset(await _mt5_call(reader.read_tickets)))
+        except Exception:
+            await asyncio.sleep(1)
+            continue
+        if h != last_hash:
+            last_hash = h
+            wake.set()
+        await asyncio.sleep(interval_s)
+
 
+async def watch_news(holder: Dict[str, Any], wake: asyncio.Event, cal_changed: asyncio.Event,
+                     window_min: int = DEFAULT_NEWS_WINDOW_MINUTES):
+    """Dorme até a próxima janela de notícia abrir; recalcula o prazo se o calendário mudar."""
+    while True:
+        cal = holder.get("cal")
+        now_utc = datetime.now(UTC)
+        nxt = cal.next_window_start(now_utc, window_min) if cal is not None else None
+        timeout = None if nxt is None else (nxt - now_utc).total_seconds() + 0.5
+        cal_changed.clear()
         try:
-            t0 = time.time()
-
-            # 0 — Atualização automática do calendário aos domingos
-            auto_update_calendar()
-
-            # 1 — Recarrega o cache a cada X minutos
-            if (t0 - last_load) > cal_refresh_min * 60:
-                events_df = load_cached_calendar()
-                last_load = t0
-
-            # 2 — Aplica a lógica de bloqueio de notícias
-            if events_df is not None:
-                report = enforce_news_window(reader, events_df)
-
-                # Se houve ordens afetadas, varrer continuamente durante a janela
-                # para garantir que nenhuma nova ordem permaneça aberta no evento.
-                if report and report.get("affected"):
-                    debug("Notícia detectada — iniciando varredura contínua até limpar tudo…")
-                    consolidated = dict(report)
-                    window_min = DEFAULT_NEWS_WINDOW_MINUTES  # mesmo valor padrão usado no enforce
-
-                    while True:
-                        # Fecha novamente caso novas ordens apareçam na janela
-                        try:
-                            extra = enforce_news_window(reader, events_df, window_min=window_min)
-                            consolidated = _merge_reports(consolidated, extra)
-                        except Exception as e:
-                            debug(f"Erro ao varrer novas ordens durante evento: {e!r}")
-
-                        try:
-                            snap2 = reader.snapshot()
-                        except Exception:
-                            debug("MT5 indisponível enquanto aguarda fechamento… tentando de novo…")
-                            time.sleep(2)
-                            continue
-
-                        now2 = datetime.utcnow().replace(tzinfo=pytz.UTC)
-                        open_positions = snap2.get("positions", []) or []
-
-                        event_tickets = {
-                            int(p.get("ticket", -1))
-                            for p in open_positions
-                            if isinstance(p, dict)
-                            and p.get("ticket") is not None
-                            and find_events(
-                                events_df,
-                                map_symbol_currencies(str(p.get("symbol", ""))),
-                                now2,
-                                window_min,
-                            )
-                        }
-
-                        if not event_tickets:
-                            break
-
-                        debug(f"Aguardando... ordens de notícia ainda abertas: {event_tickets}")
-                        time.sleep(1)
-
-                    debug("Todas as ordens afetadas pela notícia foram encerradas.")
-                    debug("Desligando AutoTrade (uia.py)…")
-                    ensure_autotrading_off()
-
-                    # Aviso no Telegram DEPOIS de tudo estar encerrado
-                    debug("Enviando relatório de notícia para o Telegram…")
-                    notify_news(consolidated)
+            await asyncio.wait_for(cal_changed.wait(), timeout=timeout)
+            continue
+        except asyncio.TimeoutError:
+            pass
+        debug(f"Janela de notícia abrindo ({nxt}).")
+        wake.set()
+
+
+async def watch_kill(wake: asyncio.Event, max_idle_s: float):
+    """Executa os prazos vencidos (ex.: fim do kill-switch) olhando só o topo da fila."""
+    while True:
+        due = _pop_due_deadlines(time.time())
+        for action in due:
+            try:
+                await _mt5_call(action)
+            except Exception as e:
+                debug(f"Erro ao executar prazo agendado: {e!r}")
+        if due:
+            wake.set()
+        nxt = _next_deadline_ts()
+        delay = max_idle_s if nxt is None else min(max_idle_s, nxt - time.time())
+        await asyncio.sleep(max(0.05, delay))
 
+
+async def watch_calendar(holder: Dict[str, Any], wake: asyncio.Event, cal_changed: asyncio.Event,
+                         max_idle_s: float):
+    """Atualização de domingo + recarga do cache quando o arquivo muda."""
+    while True:
+        try:
+            await asyncio.to_thread(auto_update_calendar)
+            if await asyncio.to_thread(_reload_calendar_if_changed, holder):
+                cal_changed.set()
+                wake.set()
         except Exception as e:
-            debug(f"Erro no loop principal: {e!r}")
-            time.sleep(2)
+            debug(f"Erro ao atualizar calendário: {e!r}")
+        await asyncio.sleep(max_idle_s)
+
+
+async def _daemon(reader: RiskGuardMT5Reader, poll_s: float):
+    wake = asyncio.Event()
+    cal_changed = asyncio.Event()
+    holder: Dict[str, Any] = {"cal": None, "mtime": None}
+    _reload_calendar_if_changed(holder)
+
+    # kill-switch já configurado antes do daemon subir
+    ks = kill_status()
+    if ks["until"] is not None:
+        schedule_reenable(time.time() + (ks["remaining_sec"] or 0.0))
+
+    busy = asyncio.Event()
+
+    async def enforce_loop():
+        while True:
+            # Com janela de notícia aberta, roda pelo menos a cada poll_s mesmo sem outro gatilho
+            cal = holder["cal"]
+            heartbeat = poll_s if cal is not None and cal.window_open(datetime.now(UTC), DEFAULT_NEWS_WINDOW_MINUTES) else None
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            busy.set()
+            try:
+                ok = await _mt5_call(_enforce_once, reader, holder["cal"])
+            except Exception as e:
+                debug(f"Erro no loop principal: {e!r}")
+                await asyncio.sleep(2)
+                ok = False
+            finally:
+                busy.clear()
+            if not ok:
+                wake.set()  # passada falhou (MT5 indisponível): tenta de novo
+
+    await asyncio.gather(
+        watch_positions(reader, wake, busy),
+        watch_news(holder, wake, cal_changed),
+        watch_kill(wake, poll_s),
+        watch_calendar(holder, wake, cal_changed, poll_s),
+        enforce_loop(),
+    )
+
+
+def run_daemon(mt5_path: str, poll_s: int = 60):
+    """
+    Em vez de acordar a cada poll_s, o daemon roda uma passada quando:
+      - o conjunto de tickets muda (watch_positions);
+      - a próxima janela de notícia abre (watch_news);
+      - vence um prazo agendado, como o fim do kill-switch (watch_kill);
+      - o calendário é recarregado (watch_calendar, checado a cada poll_s);
+      - com janela de notícia aberta, no máximo a cada poll_s (e logo em seguida se a passada falhou).
+    """
+    debug(f"Iniciando monitor de notícias (MT5={mt5_path})")
+    reader = RiskGuardMT5Reader(path=mt5_path)
+    if not reader.connect():
+        debug("Falha ao conectar MT5.")
+        sys.exit(2)
 
-        time.sleep(poll_s)
+    asyncio.run(_daemon(reader, poll_s))
 
 
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--mt5-path", default=r"C:\\Program Files\\MetaTrader 5\\terminal64.exe")
-    p.add_argument("--poll", type=int, default=3)
-    p.add_argument("--refresh", type=int, default=10)
+    p.add_argument("--poll", type=int, default=60, help="espera máxima entre verificações (s)")
     args = p.parse_args()
-    run_daemon(args.mt5_path, poll_s=args.poll, cal_refresh_min=args.refresh)
+    run_daemon(args.mt5_path, poll_s=args.poll)
 
 
 if __name__ == "__main__":
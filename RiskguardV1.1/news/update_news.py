@@ -5,10 +5,10 @@
 # Ele baixa todos os eventos da semana e salva em formato JSON compatível
 # com o RiskGuard / news_windows.py.
 # ==============================================================================
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os, json, time, random
 import pandas as pd
-import pytz, requests
+import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from typing import List, Dict
@@ -29,7 +29,7 @@ def _df_from_raw_ff(raw) -> pd.DataFrame:
             local_dt = datetime.fromisoformat(raw_date.replace("Z", "+00:00"))
 
             # Converte para UTC corretamente
-            ts_utc = local_dt.astimezone(pytz.UTC)
+            ts_utc = local_dt.astimezone(timezone.utc)
 
             rows.append({
                 "id": ev.get("id"),
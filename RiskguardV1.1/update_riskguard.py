@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import atexit
+import hashlib
 import json
 import os
 import subprocess
@@ -13,18 +15,56 @@ REPO_ROOT = ROOT.parent if (ROOT.parent / ".git").exists() else ROOT
 LOG_DIR = ROOT / "logger" / "logs"
 LOG_FILE = LOG_DIR / "update.log"
 STATUS_PATH = ROOT / ".rg_update_status.json"
+# Hash do requirements.txt da ultima instalacao bem-sucedida. Arquivo proprio porque a UI
+# apaga o STATUS_PATH depois de exibir o resultado; fica no git dir (fora do work tree)
+# para nunca aparecer no `git status --porcelain` (que bloquearia o proximo update).
+REQS_HASH_NAME = "rg_requirements_hash.json"
+
+# Resolvidos uma vez por execucao (ambiente do git e interpretador do venv)
+_GIT_ENV: Optional[Dict[str, str]] = None
+_PYTHON_EXE: Optional[Path] = None
+_REQS_HASH_PATH: Optional[Path] = None
+_REQS_HASH_RESOLVED = False
+# Handle do update.log aberto uma vez e mantido durante toda a execucao
+_LOG_FH = None
+
+
+def _log_open():
+    global _LOG_FH
+    if _LOG_FH is None:
+        try:
+            LOG_DIR.mkdir(parents=True, exist_ok=True)
+        except Exception:
+            pass
+        try:
+            # line-buffered: cada linha chega ao disco sem reabrir o arquivo
+            _LOG_FH = LOG_FILE.open("a", encoding="utf-8", buffering=1)
+        except Exception:
+            _LOG_FH = None
+    return _LOG_FH
+
+
+def _log_close() -> None:
+    global _LOG_FH
+    if _LOG_FH is not None:
+        try:
+            _LOG_FH.close()
+        except Exception:
+            pass
+        _LOG_FH = None
+
+
+atexit.register(_log_close)
 
 
 def _log(message: str) -> None:
     ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     line = f"{ts} - {message}"
+    fh = _log_open()
+    if fh is None:
+        return
     try:
-        LOG_DIR.mkdir(parents=True, exist_ok=True)
-    except Exception:
-        pass
-    try:
-        with LOG_FILE.open("a", encoding="utf-8") as fh:
-            fh.write(line + "\n")
+        fh.write(line + "\n")
     except Exception:
         pass
 
@@ -37,8 +77,26 @@ def _write_status(ok: bool, message: str, version: str = "") -> None:
         pass
 
 
-def _run(cmd: List[str], cwd: Optional[Path] = None, env: Optional[Dict[str, str]] = None) -> subprocess.CompletedProcess:
+def _run(
+    cmd: List[str],
+    cwd: Optional[Path] = None,
+    env: Optional[Dict[str, str]] = None,
+    capture: bool = True,
+) -> subprocess.CompletedProcess:
     _log("RUN: " + " ".join(cmd))
+    if not capture:
+        # Saida nao e usada pelo chamador: vai direto para o update.log (sem buffer em memoria,
+        # progresso visivel durante a execucao). stdout/stderr do resultado ficam None.
+        fh = _log_open()
+        if fh is not None:
+            fh.flush()  # o processo filho escreve no mesmo arquivo, depois da linha RUN:
+        return subprocess.run(
+            cmd,
+            cwd=str(cwd) if cwd else None,
+            env=env,
+            stdout=fh if fh is not None else subprocess.DEVNULL,
+            stderr=subprocess.STDOUT,
+        )
     result = subprocess.run(
         cmd,
         cwd=str(cwd) if cwd else None,
@@ -54,46 +112,104 @@ def _run(cmd: List[str], cwd: Optional[Path] = None, env: Optional[Dict[str, str
 
 
 def _git_env() -> Dict[str, str]:
-    env = os.environ.copy()
-    env["GIT_TERMINAL_PROMPT"] = "0"
-    return env
-
-
-def _git(*args: str) -> subprocess.CompletedProcess:
-    return _run(["git", *args], cwd=REPO_ROOT, env=_git_env())
+    global _GIT_ENV
+    if _GIT_ENV is None:
+        env = os.environ.copy()
+        env["GIT_TERMINAL_PROMPT"] = "0"
+        _GIT_ENV = env
+    return _GIT_ENV
 
 
-def _ensure_git() -> Tuple[bool, str]:
-    result = _run(["git", "--version"], cwd=REPO_ROOT, env=_git_env())
-    if result.returncode != 0:
-        return False, "Git nao encontrado no sistema."
-    return True, ""
+def _git(*args: str, capture: bool = True) -> subprocess.CompletedProcess:
+    return _run(["git", *args], cwd=REPO_ROOT, env=_git_env(), capture=capture)
 
 
-def _ensure_repo_clean() -> Tuple[bool, str]:
-    result = _git("status", "--porcelain")
+def _check_repo() -> Tuple[int, str]:
+    """
+    Um unico `git status --porcelain` no caminho feliz: se ele roda, o git existe e
+    estamos num work tree. So em caso de falha gasta um processo extra (rev-parse)
+    para diferenciar "nao e repositorio" de "falha no status".
+    Retorna (codigo de saida do main, mensagem); 0 = ok.
+    """
+    try:
+        result = _git("status", "--porcelain")
+    except OSError:
+        return 1, "Git nao encontrado no sistema."
     if result.returncode != 0:
-        return False, "Falha ao verificar o status do repositorio."
+        inside = _git("rev-parse", "--is-inside-work-tree")
+        if inside.returncode != 0 or inside.stdout.strip() != "true":
+            return 3, "Diretorio nao e um repositorio Git valido."
+        return 2, "Falha ao verificar o status do repositorio."
     if result.stdout.strip():
-        return False, "Repositorio com alteracoes locais. Salve/commit antes de atualizar."
-    return True, ""
+        return 2, "Repositorio com alteracoes locais. Salve/commit antes de atualizar."
+    return 0, ""
 
 
 def _latest_tag() -> str:
-    result = _git("for-each-ref", "--sort=-creatordate", "--format=%(refname:short)", "refs/tags")
+    # --count=1: o git devolve so a tag mais recente, sem listar/ordenar tudo no Python
+    result = _git("for-each-ref", "--count=1", "--sort=-creatordate", "--format=%(refname:short)", "refs/tags")
     if result.returncode != 0:
         return ""
-    for line in result.stdout.splitlines():
-        tag = line.strip()
-        if tag:
-            return tag
-    return ""
+    return result.stdout.strip()
+
+
+def _reqs_hash_path() -> Optional[Path]:
+    """
+    Caminho do registro de hash dentro do git dir real (tambem em worktree/submodulo,
+    onde .git e um arquivo). None se nao ha git dir: sem registro, o pip sempre roda.
+    """
+    global _REQS_HASH_PATH, _REQS_HASH_RESOLVED
+    if not _REQS_HASH_RESOLVED:
+        _REQS_HASH_RESOLVED = True
+        try:
+            result = _git("rev-parse", "--git-dir")
+        except OSError:
+            result = None
+        if result is not None and result.returncode == 0 and result.stdout.strip():
+            git_dir = Path(result.stdout.strip())
+            if not git_dir.is_absolute():
+                git_dir = REPO_ROOT / git_dir
+            _REQS_HASH_PATH = git_dir / REQS_HASH_NAME
+    return _REQS_HASH_PATH
+
+
+def _load_reqs_hash() -> Dict[str, str]:
+    path = _reqs_hash_path()
+    if path is None:
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _write_reqs_hash(payload: Optional[Dict[str, str]]) -> None:
+    path = _reqs_hash_path()
+    if path is None:
+        return
+    try:
+        if payload is None:
+            path.unlink()
+        else:
+            path.write_text(json.dumps(payload, indent=2, ensure_ascii=True), encoding="utf-8")
+    except Exception:
+        pass
 
 
 def _pip_install(requirements: Path) -> Tuple[bool, str]:
     if not requirements.exists():
         return True, ""
     python_exe = _find_python()
+    # requirements.txt igual ao da ultima instalacao (no mesmo interpretador) -> pula o pip
+    try:
+        req_hash = hashlib.blake2b(requirements.read_bytes(), digest_size=16).hexdigest()
+    except OSError:
+        req_hash = ""
+    current = {"requirements_hash": req_hash, "python": str(python_exe)}
+    if req_hash and _load_reqs_hash() == current:
+        _log("requirements.txt sem alteracoes; pip install ignorado.")
+        return True, ""
     cmd = [
         str(python_exe),
         "-m",
@@ -104,17 +220,21 @@ def _pip_install(requirements: Path) -> Tuple[bool, str]:
         "-r",
         str(requirements),
     ]
-    result = _run(cmd, cwd=ROOT)
+    result = _run(cmd, cwd=ROOT, capture=False)
     if result.returncode != 0:
+        _write_reqs_hash(None)
         return False, "Falha ao instalar dependencias. Veja update.log."
+    if req_hash:
+        _write_reqs_hash(current)
     return True, ""
 
 
 def _find_python() -> Path:
-    venv_python = ROOT / "venv" / "Scripts" / "python.exe"
-    if venv_python.exists():
-        return venv_python
-    return Path(sys.executable)
+    global _PYTHON_EXE
+    if _PYTHON_EXE is None:
+        venv_python = ROOT / "venv" / "Scripts" / "python.exe"
+        _PYTHON_EXE = venv_python if venv_python.exists() else Path(sys.executable)
+    return _PYTHON_EXE
 
 
 def _load_terminal_path() -> str:
@@ -163,22 +283,12 @@ def _restart_ui() -> None:
 
 def main() -> int:
     _log("Update start.")
-    ok, msg = _ensure_git()
-    if not ok:
-        _write_status(False, msg)
-        return 1
-
-    ok, msg = _ensure_repo_clean()
-    if not ok:
+    code, msg = _check_repo()
+    if code:
         _write_status(False, msg)
-        return 2
-
-    result = _git("rev-parse", "--is-inside-work-tree")
-    if result.returncode != 0 or result.stdout.strip() != "true":
-        _write_status(False, "Diretorio nao e um repositorio Git valido.")
-        return 3
+        return code
 
-    result = _git("fetch", "--tags", "--prune")
+    result = _git("fetch", "--tags", "--prune", capture=False)
     if result.returncode != 0:
         _write_status(False, "Falha ao buscar atualizacoes do GitHub.")
         return 4
@@ -186,13 +296,13 @@ def main() -> int:
     version = ""
     tag = _latest_tag()
     if tag:
-        result = _git("checkout", "-B", "release", tag)
+        result = _git("checkout", "-B", "release", tag, capture=False)
         if result.returncode != 0:
             _write_status(False, f"Falha ao aplicar tag {tag}.")
             return 5
         version = tag
     else:
-        result = _git("pull", "--ff-only")
+        result = _git("pull", "--ff-only", capture=False)
         if result.returncode != 0:
             _write_status(False, "Falha ao atualizar a branch principal.")
             return 6